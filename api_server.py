@@ -5,14 +5,19 @@ Serves predictions to QuantConnect
 
 from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from supabase import create_client, Client
+from fastapi.responses import ORJSONResponse
+from db import supabase
+import redis
+import orjson
 import os
+import time
 from datetime import datetime
 
 app = FastAPI(
     title="AI Trading Agent API",
     description="Serves stock predictions to QuantConnect",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS
@@ -23,11 +28,96 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Supabase
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
+# Response cache (optional - disabled when REDIS_URL is unset)
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL = int(os.getenv("CACHE_TTL", 120))
+CACHE_BACKOFF = 30  # Skip Redis this long after an error
+
+cache = None
+if CACHE_ENABLED and os.getenv("REDIS_URL"):
+    cache = redis.Redis.from_url(
+        os.getenv("REDIS_URL"),
+        socket_timeout=0.5,
+        socket_connect_timeout=0.5
+    )
+_cache_down_until = {"ts": float("-inf")}
+
+def cache_available():
+    """Whether Redis is configured and not backing off after an error"""
+    return cache is not None and time.monotonic() >= _cache_down_until["ts"]
+
+def cache_failed(action: str, key: str, error: Exception):
+    """Log a Redis error and stop using the cache for CACHE_BACKOFF seconds"""
+    print(f"⚠️ Cache {action} failed for {key}, bypassing for {CACHE_BACKOFF}s: {error}")
+    _cache_down_until["ts"] = time.monotonic() + CACHE_BACKOFF
+
+def cache_get(key: str):
+    """Return cached response for key, or None on miss/error"""
+    if not cache_available():
+        return None
+    try:
+        cached = cache.get(key)
+        return orjson.loads(cached) if cached else None
+    except redis.exceptions.RedisError as e:
+        cache_failed("read", key, e)
+        return None
+    except orjson.JSONDecodeError as e:
+        print(f"⚠️ Ignoring non-JSON cache entry for {key}: {e}")
+        return None
+
+def cache_set(key: str, value: dict):
+    """Store response under key, ignoring cache errors"""
+    if not cache_available():
+        return
+    try:
+        cache.setex(key, CACHE_TTL, orjson.dumps(value))
+    except redis.exceptions.RedisError as e:
+        cache_failed("write", key, e)
+
+# Tickers with predictions, refreshed from latest_predictions every TICKERS_TTL seconds
+TICKERS_TTL = 3600
+TICKERS_RETRY = 10  # Backoff after a failed refresh
+_tickers_cache = {"ts": float("-inf"), "failed_ts": float("-inf"), "tickers": frozenset()}
+
+def is_tracked(ticker: str):
+    """Check ticker against the in-memory allowlist before touching the DB"""
+    now = time.monotonic()
+    
+    if now - _tickers_cache["ts"] >= TICKERS_TTL and \
+            now - _tickers_cache["failed_ts"] >= TICKERS_RETRY:
+        try:
+            result = supabase.table("latest_predictions").select("ticker").execute()
+            _tickers_cache["tickers"] = frozenset(row["ticker"] for row in result.data)
+            _tickers_cache["ts"] = now
+        except Exception as e:
+            print(f"⚠️ Could not refresh ticker allowlist: {e}")
+            _tickers_cache["failed_ts"] = now
+    
+    # Fail open until the allowlist has been loaded
+    return not _tickers_cache["tickers"] or ticker in _tickers_cache["tickers"]
+
+# Response timestamps only need second resolution
+_ts_cache = [0.0, ""]
+
+def now_iso():
+    """Current time as ISO string, reformatted at most once per second"""
+    t = time.time()
+    if t - _ts_cache[0] >= 1.0:
+        _ts_cache[0] = t
+        _ts_cache[1] = datetime.fromtimestamp(t).isoformat()
+    return _ts_cache[1]
+
+def format_prediction(ticker: str, prediction: dict):
+    """Shape a predictions row into the API response"""
+    return {
+        "ticker": ticker,
+        "signal": prediction["signal"],
+        "confidence": float(prediction["confidence"]),
+        "reasoning": prediction["reasoning"],
+        "key_factors": prediction.get("key_factors", []),
+        "risks": prediction.get("risks", []),
+        "timestamp": prediction["created_at"]
+    }
 
 @app.get("/")
 def root():
@@ -43,28 +133,45 @@ def root():
         }
     }
 
+# Last database probe, reused by /health for HEALTH_TTL seconds
+HEALTH_TTL = 10
+HEALTH_STALE_TTL = 60  # How long a failed probe may report last-known-good
+_health_cache = {"ts": float("-inf"), "last_ok": float("-inf"), "connected": False}
+
 @app.get("/health")
 def health_check():
     """Health check for monitoring"""
-    try:
-        # Test database connection
-        supabase.table("predictions").select("id").limit(1).execute()
-        db_status = "connected"
-    except:
-        db_status = "disconnected"
+    now = time.monotonic()
+    
+    if now - _health_cache["ts"] >= HEALTH_TTL:
+        try:
+            # Test database connection
+            supabase.table("predictions").select("id").limit(1).execute()
+            _health_cache["connected"] = True
+            _health_cache["last_ok"] = now
+        except Exception:
+            _health_cache["connected"] = False
+        _health_cache["ts"] = now
+    
+    # Serve last-known-good for a short while if the latest probe failed
+    stale = not _health_cache["connected"] and \
+        now - _health_cache["last_ok"] < HEALTH_STALE_TTL
+    db_status = "connected" if _health_cache["connected"] or stale else "disconnected"
     
     return {
         "status": "healthy" if db_status == "connected" else "degraded",
-        "timestamp": datetime.now().isoformat(),
-        "database": db_status
+        "timestamp": now_iso(),
+        "database": db_status,
+        "stale": stale
     }
 
 @app.get("/predict")
-def get_prediction(ticker: str):
+def get_prediction(ticker: str, refresh: bool = False):
     """
     Get latest prediction for a ticker
     
     Example: /predict?ticker=AAPL
+    Pass refresh=true to bypass the cache.
     
     Returns:
         {
@@ -76,13 +183,24 @@ def get_prediction(ticker: str):
         }
     """
     ticker = ticker.upper().strip()
+    key = f"pred:{ticker}"
+    
+    if not is_tracked(ticker):
+        raise HTTPException(
+            status_code=404,
+            detail=f"No predictions found for {ticker}"
+        )
+    
+    if not refresh:
+        cached = cache_get(key)
+        if cached:
+            return cached
     
     try:
-        # Get latest prediction
-        result = supabase.table("predictions") \
+        # Get latest prediction (one row per ticker, maintained on insert)
+        result = supabase.table("latest_predictions") \
             .select("*") \
             .eq("ticker", ticker) \
-            .order("created_at", desc=True) \
             .limit(1) \
             .execute()
         
@@ -92,17 +210,10 @@ def get_prediction(ticker: str):
                 detail=f"No predictions found for {ticker}"
             )
         
-        prediction = result.data[0]
+        response = format_prediction(ticker, result.data[0])
+        cache_set(key, response)
         
-        return {
-            "ticker": ticker,
-            "signal": prediction["signal"],
-            "confidence": float(prediction["confidence"]),
-            "reasoning": prediction["reasoning"],
-            "key_factors": prediction.get("key_factors", []),
-            "risks": prediction.get("risks", []),
-            "timestamp": prediction["created_at"]
-        }
+        return response
         
     except HTTPException:
         raise
@@ -129,47 +240,80 @@ def batch_predict(tickers: str):
         }
     """
     ticker_list = [t.strip().upper() for t in tickers.split(",")]
+    tracked = list({t for t in ticker_list if is_tracked(t)})
+    
+    latest = {}
+    if tracked:
+        try:
+            # Latest row per ticker in one query
+            result = supabase.table("latest_predictions") \
+                .select("*") \
+                .in_("ticker", tracked) \
+                .execute()
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error retrieving predictions: {str(e)}"
+            )
+        
+        latest = {row["ticker"]: row for row in result.data or []}
     
     predictions = []
     for ticker in ticker_list:
-        try:
-            pred = get_prediction(ticker)
-            predictions.append(pred)
-        except HTTPException as e:
+        if ticker in latest:
+            predictions.append(format_prediction(ticker, latest[ticker]))
+        else:
             predictions.append({
                 "ticker": ticker,
-                "error": e.detail,
+                "error": f"No predictions found for {ticker}",
                 "status": "not_found"
             })
     
     return {
         "predictions": predictions,
         "count": len(predictions),
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now_iso()
     }
 
 @app.get("/history/{ticker}")
-def get_history(ticker: str, limit: int = 10):
+def get_history(ticker: str, limit: int = 10, refresh: bool = False):
     """
     Get prediction history for a ticker
     
     Example: /history/AAPL?limit=5
+    Pass refresh=true to bypass the cache.
     """
     ticker = ticker.upper().strip()
+    limit = min(limit, 50)
+    key = f"hist:{ticker}:{limit}"
+    
+    if not is_tracked(ticker):
+        raise HTTPException(
+            status_code=404,
+            detail=f"No predictions found for {ticker}"
+        )
+    
+    if not refresh:
+        cached = cache_get(key)
+        if cached:
+            return cached
     
     try:
         result = supabase.table("predictions") \
             .select("*") \
             .eq("ticker", ticker) \
             .order("created_at", desc=True) \
-            .limit(min(limit, 50)) \
+            .limit(limit) \
             .execute()
         
-        return {
+        response = {
             "ticker": ticker,
             "history": result.data,
             "count": len(result.data)
         }
+        cache_set(key, response)
+        
+        return response
         
     except Exception as e:
         raise HTTPException(
@@ -180,4 +324,12 @@ def get_history(ticker: str, limit: int = 10):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "api_server:app",
+        host="0.0.0.0",
+        port=port,
+        workers=int(os.getenv("WEB_CONCURRENCY", 4)),
+        loop="uvloop",
+        http="httptools",
+        timeout_keep_alive=60
+    )
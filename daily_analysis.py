@@ -4,28 +4,111 @@ Runs once per day via GitHub Actions
 """
 
 import os
-import requests
-import json
-from datetime import datetime
-from supabase import create_client, Client
+import asyncio
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from supabase import Client
+import httpx
+import ijson
+import orjson
+from db import get_client
 
 # Configuration
 WATCHLIST = ["AAPL", "MSFT", "GOOGL", "NVDA", "TSLA"]
+NEWS_CONCURRENCY = 3  # Stay under AlphaVantage free-tier rate limit
+NEWS_PER_TICKER = 10
+NEWS_BATCH_LIMIT = 200  # Latest market-wide articles scanned in the batch fetch
+HISTORY_LOOKBACK_DAYS = 30  # Bounds the batched history query
+NEWS_CACHE_DIR = Path(os.getenv(
+    "NEWS_CACHE_DIR",
+    Path.home() / ".cache" / "ai-trading-agent" / "news"
+))
+
+# Structured output: Claude is forced to answer through this tool
+PREDICTION_TOOL = {
+    "name": "emit_prediction",
+    "description": "Record the trading recommendation for the ticker",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "signal": {"type": "string", "enum": ["BUY", "SELL", "HOLD"]},
+            "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+            "reasoning": {
+                "type": "string",
+                "description": "Clear 2-3 sentence explanation of why this signal"
+            },
+            "key_factors": {"type": "array", "items": {"type": "string"}},
+            "risks": {"type": "array", "items": {"type": "string"}},
+            "timeframe": {
+                "type": "string",
+                "description": "e.g. short-term (1-5 days)"
+            }
+        },
+        "required": ["signal", "confidence", "reasoning", "key_factors", "risks", "timeframe"]
+    }
+}
+
+# Identical for every ticker - sent as a cached system block
+STATIC_INSTRUCTIONS = """Based on the recent news and previous predictions provided, give a trading recommendation.
+
+Consider:
+1. News sentiment and credibility
+2. Historical patterns (if available)
+3. Potential risks and opportunities
+4. Market context
+
+Respond by calling the emit_prediction tool."""
+
+PROMPT_TEMPLATE = """Analyze {ticker} for a trading decision.
+
+RECENT NEWS (Last 24-48 hours):
+{news}
+
+PREVIOUS PREDICTIONS:
+{historical}"""
+
+# Fallback for plain-text replies
+JSON_PATTERN = re.compile(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}')
 
 class SimplifiedAgent:
     def __init__(self):
         self.anthropic_key = os.getenv("ANTHROPIC_API_KEY")
         self.alpha_vantage_key = os.getenv("ALPHA_VANTAGE_KEY")
-        self.supabase: Client = create_client(
-            os.getenv("SUPABASE_URL"),
-            os.getenv("SUPABASE_KEY")
+        self.supabase: Client = get_client()
+        
+        # One keep-alive client per host so TLS sessions are reused
+        self.alpha_vantage = httpx.AsyncClient(
+            base_url="https://www.alphavantage.co",
+            http2=True,
+            timeout=10
         )
+        self.anthropic = httpx.AsyncClient(
+            base_url="https://api.anthropic.com",
+            http2=True,
+            timeout=30,
+            headers={
+                "x-api-key": self.anthropic_key,
+                "anthropic-version": "2023-06-01",
+                "content-type": "application/json"
+            }
+        )
+    
+    async def close(self):
+        """Close the HTTP clients"""
+        await self.alpha_vantage.aclose()
+        await self.anthropic.aclose()
     
-    def fetch_news(self, ticker: str):
+    async def fetch_news(self, ticker: str):
         """Fetch latest news for ticker"""
         print(f"📰 Fetching news for {ticker}...")
         
-        url = "https://www.alphavantage.co/query"
+        cached = load_cached_news(ticker)
+        if cached is not None:
+            print(f"   Using {len(cached)} cached articles")
+            return cached
+        
         params = {
             "function": "NEWS_SENTIMENT",
             "tickers": ticker,
@@ -35,105 +118,187 @@ class SimplifiedAgent:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
+            articles = []
+            
+            # Parse the feed incrementally and stop after the top articles
+            items = ijson.sendable_list()
+            parser = ijson.items_coro(items, "feed.item")
             
-            if "feed" not in data:
+            async with self.alpha_vantage.stream("GET", "/query", params=params) as response:
+                async for chunk in response.aiter_bytes():
+                    parser.send(chunk)
+                    for item in items:
+                        articles.append(parse_article(item, ticker))
+                        if len(articles) == NEWS_PER_TICKER:
+                            break
+                    del items[:]
+                    if len(articles) == NEWS_PER_TICKER:
+                        break
+            
+            if not articles:
                 print(f"⚠️ No news data returned for {ticker}")
                 return []
             
-            articles = []
-            for item in data.get("feed", [])[:10]:  # Top 10 articles
-                articles.append({
-                    "title": item.get("title", ""),
-                    "summary": item.get("summary", ""),
-                    "source": item.get("source", ""),
-                    "sentiment": float(item.get("overall_sentiment_score", 0)),
-                    "time": item.get("time_published", "")
-                })
-            
             print(f"   Found {len(articles)} articles")
+            save_cached_news(ticker, articles)
             return articles
             
         except Exception as e:
             print(f"❌ Error fetching news for {ticker}: {e}")
             return []
     
-    def analyze_with_claude(self, ticker: str, news: list):
+    async def fetch_news_batch(self, tickers: list):
+        """Fetch latest news for all tickers with a single request"""
+        news = {}
+        for ticker in tickers:
+            cached = load_cached_news(ticker)
+            if cached is not None:
+                print(f"📰 Using {len(cached)} cached articles for {ticker}")
+                news[ticker] = cached
+        
+        buckets = {ticker: [] for ticker in tickers if ticker not in news}
+        if not buckets:
+            return news
+        
+        if len(buckets) == 1:
+            # A shared request cannot save anything for a single ticker
+            ticker = next(iter(buckets))
+            news[ticker] = await self.fetch_news(ticker)
+            return news
+        
+        print(f"📰 Fetching news for {', '.join(buckets)}...")
+        
+        # The tickers filter matches articles mentioning ALL listed tickers,
+        # so read the latest unfiltered feed and bucket items by ticker_sentiment
+        params = {
+            "function": "NEWS_SENTIMENT",
+            "apikey": self.alpha_vantage_key,
+            "limit": NEWS_BATCH_LIMIT,
+            "sort": "LATEST"
+        }
+        
+        has_feed = False
+        try:
+            first_chunk = b""
+            items = ijson.sendable_list()
+            parser = ijson.items_coro(items, "feed.item")
+            
+            async with self.alpha_vantage.stream("GET", "/query", params=params) as response:
+                async for chunk in response.aiter_bytes():
+                    first_chunk = first_chunk or chunk
+                    parser.send(chunk)
+                    for item in items:
+                        has_feed = True
+                        for ts in item.get("ticker_sentiment", []):
+                            bucket = buckets.get(ts.get("ticker"))
+                            if bucket is not None and len(bucket) < NEWS_PER_TICKER:
+                                bucket.append(parse_article(item, ts["ticker"]))
+                    del items[:]
+                    if all(len(bucket) >= NEWS_PER_TICKER for bucket in buckets.values()):
+                        break
+            
+            if not has_feed:
+                # Rate-limit and error replies carry a message instead of a feed
+                try:
+                    reply = orjson.loads(first_chunk)
+                    message = reply.get("Information") or reply.get("Note") or reply
+                except orjson.JSONDecodeError:
+                    message = "unreadable response"
+                print(f"⚠️ No news feed returned: {message}")
+        except Exception as e:
+            print(f"❌ Error fetching batched news: {e}")
+        
+        news.update(buckets)
+        if not has_feed:
+            # Per-ticker requests would hit the same limit or error
+            return news
+        
+        short = []
+        for ticker, articles in buckets.items():
+            print(f"   {ticker}: found {len(articles)} articles")
+            if len(articles) >= NEWS_PER_TICKER:
+                save_cached_news(ticker, articles)
+            else:
+                short.append(ticker)
+        
+        # Top up the least-covered tickers, keeping the total number of
+        # AlphaVantage calls at or below one per ticker
+        short.sort(key=lambda ticker: len(buckets[ticker]))
+        short = short[:len(buckets) - 1]
+        news_limit = asyncio.Semaphore(NEWS_CONCURRENCY)
+        
+        async def fetch_one(ticker):
+            async with news_limit:
+                return await self.fetch_news(ticker)
+        
+        topped_up = await asyncio.gather(*[fetch_one(ticker) for ticker in short])
+        for ticker, articles in zip(short, topped_up):
+            if articles:
+                news[ticker] = articles
+        
+        return news
+    
+    async def analyze_with_claude(self, ticker: str, news: list, historical: list):
         """Analyze using Claude API"""
         print(f"🤖 Analyzing {ticker} with Claude...")
         
         # Build context
-        news_text = "\n".join([
-            f"- {n['title']} (sentiment: {n['sentiment']:.2f}, source: {n['source']})"
-            for n in news
-        ])
-        
-        if not news_text:
-            news_text = "No recent news available"
+        lines = []
+        append = lines.append
+        for n in news:
+            append(f"- {n['title']} (sentiment: {n['sentiment']:.2f}, source: {n['source']})")
+        news_text = "\n".join(lines) or "No recent news available"
         
-        # Get historical predictions
-        historical = self.get_historical_predictions(ticker, limit=5)
-        historical_text = "\n".join([
-            f"- {h['created_at'][:10]}: {h['signal']} "
-            f"(confidence: {h['confidence']}) - {h['reasoning'][:80]}..."
-            for h in historical
-        ]) if historical else "No historical predictions yet"
+        lines = []
+        append = lines.append
+        for h in historical:
+            append(
+                f"- {h['created_at'][:10]}: {h['signal']} "
+                f"(confidence: {h['confidence']}) - {h['reasoning'][:80]}..."
+            )
+        historical_text = "\n".join(lines) or "No historical predictions yet"
         
-        prompt = f"""Analyze {ticker} for a trading decision.
-
-RECENT NEWS (Last 24-48 hours):
-{news_text}
-
-PREVIOUS PREDICTIONS:
-{historical_text}
-
-Based on this information, provide a trading recommendation.
-
-Consider:
-1. News sentiment and credibility
-2. Historical patterns (if available)
-3. Potential risks and opportunities
-4. Market context
-
-Respond in this EXACT JSON format (no extra text):
-{{
-  "signal": "BUY" or "SELL" or "HOLD",
-  "confidence": 0.75,
-  "reasoning": "Clear 2-3 sentence explanation of why this signal",
-  "key_factors": ["factor1", "factor2", "factor3"],
-  "risks": ["risk1", "risk2"],
-  "timeframe": "short-term (1-5 days)"
-}}"""
+        prompt = PROMPT_TEMPLATE.format(
+            ticker=ticker,
+            news=news_text,
+            historical=historical_text
+        )
 
         # Call Claude
         try:
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers={
-                    "x-api-key": self.anthropic_key,
-                    "anthropic-version": "2023-06-01",
-                    "content-type": "application/json"
-                },
-                json={
+            response = await self.anthropic.post(
+                "/v1/messages",
+                content=orjson.dumps({
                     "model": "claude-sonnet-4-20250514",
                     "max_tokens": 1500,
+                    "tools": [PREDICTION_TOOL],
+                    "tool_choice": {"type": "tool", "name": PREDICTION_TOOL["name"]},
+                    "system": [{
+                        "type": "text",
+                        "text": STATIC_INSTRUCTIONS,
+                        "cache_control": {"type": "ephemeral"}
+                    }],
                     "messages": [{"role": "user", "content": prompt}]
-                },
-                timeout=30
+                })
             )
             
             response.raise_for_status()
-            result = response.json()
+            result = orjson.loads(response.content)
             
-            # Extract text from response
-            text = result["content"][0]["text"]
+            # Tool input is already a parsed dict
+            prediction = next(
+                (block["input"] for block in result["content"] if block["type"] == "tool_use"),
+                None
+            )
             
-            # Parse JSON from response
-            import re
-            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', text)
-            if json_match:
-                prediction = json.loads(json_match.group())
+            if prediction is None:
+                # Parse JSON from a text reply
+                text = "".join(block.get("text", "") for block in result["content"])
+                json_match = JSON_PATTERN.search(text)
+                if json_match:
+                    prediction = orjson.loads(json_match.group())
+            
+            if prediction:
                 print(f"   Signal: {prediction['signal']} (confidence: {prediction['confidence']})")
                 return prediction
             else:
@@ -144,45 +309,104 @@ Respond in this EXACT JSON format (no extra text):
             print(f"❌ Error calling Claude: {e}")
             return None
     
-    def get_historical_predictions(self, ticker: str, limit: int = 5):
-        """Get past predictions for context"""
+    async def get_historical_predictions(self, tickers: list, limit: int = 5):
+        """Get past predictions for context, grouped by ticker"""
+        since = (datetime.now() - timedelta(days=HISTORY_LOOKBACK_DAYS)).isoformat()
+        historical = defaultdict(list)
+        
         try:
-            result = self.supabase.table("predictions") \
+            query = self.supabase.table("predictions") \
                 .select("*") \
-                .eq("ticker", ticker) \
-                .order("created_at", desc=True) \
-                .limit(limit) \
-                .execute()
+                .in_("ticker", tickers) \
+                .gte("created_at", since) \
+                .order("created_at", desc=True)
+            result = await asyncio.to_thread(query.execute)
             
-            return result.data if result.data else []
+            for row in result.data or []:
+                if len(historical[row["ticker"]]) < limit:
+                    historical[row["ticker"]].append(row)
         except Exception as e:
             print(f"⚠️ Error fetching historical: {e}")
-            return []
+        
+        return historical
     
-    def store_prediction(self, ticker: str, prediction: dict):
-        """Store prediction in Supabase"""
-        print(f"💾 Storing prediction for {ticker}...")
+    async def store_predictions(self, predictions: dict):
+        """Store all predictions in Supabase with a single insert"""
+        if not predictions:
+            return None
+        
+        print(f"\n💾 Storing {len(predictions)} predictions...")
         
         try:
-            data = {
-                "ticker": ticker,
-                "signal": prediction["signal"],
-                "confidence": float(prediction["confidence"]),
-                "reasoning": prediction["reasoning"],
-                "key_factors": prediction.get("key_factors", []),
-                "risks": prediction.get("risks", []),
-                "created_at": datetime.now().isoformat()
-            }
+            rows = [build_row(t, p) for t, p in predictions.items()]
             
-            result = self.supabase.table("predictions").insert(data).execute()
+            query = self.supabase.table("predictions").insert(rows)
+            result = await asyncio.to_thread(query.execute)
             print(f"   ✅ Stored successfully")
             return result
             
         except Exception as e:
-            print(f"   ❌ Error storing prediction: {e}")
+            print(f"   ❌ Error storing predictions: {e}")
             return None
 
-def main():
+def news_cache_path(ticker: str):
+    """Cache file for ticker's news, bucketed by UTC hour"""
+    hour = datetime.now(timezone.utc).strftime("%Y%m%d%H")
+    return NEWS_CACHE_DIR / f"{ticker}-{hour}.json"
+
+def load_cached_news(ticker: str):
+    """Return this hour's cached articles for ticker, or None"""
+    try:
+        return orjson.loads(news_cache_path(ticker).read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError) as e:
+        print(f"⚠️ Ignoring unreadable news cache for {ticker}: {e}")
+        return None
+
+def save_cached_news(ticker: str, articles: list):
+    """Cache articles for reruns within the same hour"""
+    try:
+        path = news_cache_path(ticker)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(orjson.dumps(articles))
+        
+        # Drop files from earlier hours
+        for old in path.parent.glob(f"{ticker}-*.json"):
+            if old != path:
+                old.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"⚠️ Could not cache news for {ticker}: {e}")
+
+def parse_article(item: dict, ticker: str):
+    """Shape a NEWS_SENTIMENT feed item, scored for ticker"""
+    sentiment = item.get("overall_sentiment_score", 0)
+    for ts in item.get("ticker_sentiment", []):
+        if ts.get("ticker") == ticker:
+            sentiment = ts.get("ticker_sentiment_score", sentiment)
+            break
+    
+    return {
+        "title": item.get("title", ""),
+        "summary": item.get("summary", ""),
+        "source": item.get("source", ""),
+        "sentiment": float(sentiment),
+        "time": item.get("time_published", "")
+    }
+
+def build_row(ticker: str, prediction: dict):
+    """Build a predictions table row from a Claude prediction"""
+    return {
+        "ticker": ticker,
+        "signal": prediction["signal"],
+        "confidence": float(prediction["confidence"]),
+        "reasoning": prediction["reasoning"],
+        "key_factors": prediction.get("key_factors", []),
+        "risks": prediction.get("risks", []),
+        "created_at": datetime.now().isoformat()
+    }
+
+async def main():
     """Main execution"""
     print("=" * 60)
     print("🚀 AI Trading Agent - Daily Analysis")
@@ -192,22 +416,26 @@ def main():
     # Initialize agent
     agent = SimplifiedAgent()
     
-    # Analyze each stock
-    results = []
-    for ticker in WATCHLIST:
-        print(f"\n{'='*60}")
-        print(f"📊 Analyzing {ticker}")
-        print(f"{'='*60}")
-        
-        # Fetch news
-        news = agent.fetch_news(ticker)
-        
-        # Analyze
-        prediction = agent.analyze_with_claude(ticker, news)
+    try:
+        # News and previous predictions for the whole watchlist, one call each
+        news, historical = await asyncio.gather(
+            agent.fetch_news_batch(WATCHLIST),
+            agent.get_historical_predictions(WATCHLIST, limit=5)
+        )
         
+        # Analyze all stocks concurrently
+        predictions = await asyncio.gather(*[
+            agent.analyze_with_claude(ticker, news[ticker], historical[ticker])
+            for ticker in WATCHLIST
+        ])
+    finally:
+        await agent.close()
+    
+    results = []
+    successful = {}
+    for ticker, prediction in zip(WATCHLIST, predictions):
         if prediction:
-            # Store prediction
-            agent.store_prediction(ticker, prediction)
+            successful[ticker] = prediction
             results.append({
                 "ticker": ticker,
                 "status": "success",
@@ -220,6 +448,9 @@ def main():
                 "status": "failed"
             })
     
+    # Store all predictions in one round-trip
+    await agent.store_predictions(successful)
+    
     # Summary
     print(f"\n{'='*60}")
     print("📊 SUMMARY")
@@ -234,4 +465,4 @@ def main():
     print("=" * 60)
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -0,0 +1,31 @@
+"""
+Shared Supabase client
+One client (and keep-alive connection pool) per process
+"""
+
+import os
+from functools import lru_cache
+from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
+import httpx
+
+@lru_cache(maxsize=None)
+def get_client() -> Client:
+    """Create the Supabase client once per process"""
+    return create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_KEY"),
+        options=ClientOptions(
+            httpx_client=httpx.Client(
+                http2=True,
+                timeout=10.0,
+                limits=httpx.Limits(
+                    max_keepalive_connections=20,
+                    max_connections=40,
+                    keepalive_expiry=60
+                )
+            )
+        )
+    )
+
+supabase: Client = get_client()
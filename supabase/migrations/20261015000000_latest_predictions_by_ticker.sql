@@ -0,0 +1,11 @@
+-- Latest prediction per ticker in a single round-trip (used by /batch-predict)
+create or replace function latest_predictions_by_ticker(tickers text[])
+returns setof predictions
+language sql
+stable
+as $$
+    select distinct on (ticker) *
+    from predictions
+    where ticker = any(tickers)
+    order by ticker, created_at desc;
+$$;
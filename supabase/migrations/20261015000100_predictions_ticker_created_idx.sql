@@ -0,0 +1,4 @@
+-- Serves every "latest predictions for ticker" lookup:
+-- /predict, /history, latest_predictions_by_ticker and the daily history prefetch
+create index if not exists idx_predictions_ticker_created
+    on predictions (ticker, created_at desc);
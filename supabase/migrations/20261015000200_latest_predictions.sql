@@ -0,0 +1,38 @@
+-- One row per ticker, kept current by a trigger on predictions
+create table latest_predictions (like predictions including defaults);
+alter table latest_predictions add primary key (ticker);
+
+insert into latest_predictions
+select distinct on (ticker) *
+from predictions
+order by ticker, created_at desc;
+
+create or replace function upsert_latest_pred()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into latest_predictions
+        (id, ticker, signal, confidence, reasoning, key_factors, risks, created_at)
+    values
+        (new.id, new.ticker, new.signal, new.confidence, new.reasoning,
+         new.key_factors, new.risks, new.created_at)
+    on conflict (ticker) do update set
+        id = excluded.id,
+        signal = excluded.signal,
+        confidence = excluded.confidence,
+        reasoning = excluded.reasoning,
+        key_factors = excluded.key_factors,
+        risks = excluded.risks,
+        created_at = excluded.created_at
+    where latest_predictions.created_at <= excluded.created_at;
+    return new;
+end;
+$$;
+
+create trigger upsert_latest
+after insert on predictions
+for each row execute function upsert_latest_pred();
+
+-- /batch-predict reads latest_predictions directly now
+drop function if exists latest_predictions_by_ticker(text[]);
@@ -0,0 +1,39 @@
+-- latest_predictions is read-only over PostgREST; only the trigger writes it
+alter table latest_predictions enable row level security;
+
+create policy "latest_predictions are readable"
+    on latest_predictions
+    for select
+    using (true);
+
+revoke insert, update, delete on latest_predictions from anon, authenticated;
+
+-- Runs as the table owner so the trigger can write past RLS.
+-- Columns are copied by name; a column added to predictions is not mirrored
+-- until it is added to latest_predictions and to both lists below.
+create or replace function upsert_latest_pred()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into latest_predictions
+        (id, ticker, signal, confidence, reasoning, key_factors, risks, created_at)
+    values
+        (new.id, new.ticker, new.signal, new.confidence, new.reasoning,
+         new.key_factors, new.risks, new.created_at)
+    on conflict (ticker) do update set
+        id = excluded.id,
+        signal = excluded.signal,
+        confidence = excluded.confidence,
+        reasoning = excluded.reasoning,
+        key_factors = excluded.key_factors,
+        risks = excluded.risks,
+        created_at = excluded.created_at
+    where latest_predictions.created_at <= excluded.created_at;
+    return new;
+end;
+$$;
+
+revoke execute on function upsert_latest_pred() from public, anon, authenticated;
@@ -0,0 +1,29 @@
+-- Copy columns by name, not position. latest_predictions is a one-time
+-- LIKE copy of predictions, so a positional new.* breaks every insert into
+-- predictions once it gains a column. New columns are simply not mirrored
+-- into latest_predictions until added to both lists below and to the table.
+create or replace function upsert_latest_pred()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into latest_predictions
+        (id, ticker, signal, confidence, reasoning, key_factors, risks, created_at)
+    values
+        (new.id, new.ticker, new.signal, new.confidence, new.reasoning,
+         new.key_factors, new.risks, new.created_at)
+    on conflict (ticker) do update set
+        id = excluded.id,
+        signal = excluded.signal,
+        confidence = excluded.confidence,
+        reasoning = excluded.reasoning,
+        key_factors = excluded.key_factors,
+        risks = excluded.risks,
+        created_at = excluded.created_at
+    where latest_predictions.created_at <= excluded.created_at;
+    return new;
+end;
+$$;
+